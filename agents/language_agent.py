@@ -3,8 +3,6 @@ Agente de Lenguaje: Generación de descripciones naturales usando OLLAMA.
 """
 
 import logging
-import hashlib
-import json
 import requests
 from typing import List, Dict, Optional
 from ollama import Client
@@ -49,15 +47,16 @@ class LanguageAgent:
             logger.error(f"Error al inicializar cliente OLLAMA: {e}")
             self.client = None
     
-    def _create_hash_from_detections(self, detections: List[Dict]) -> str:
+    def _normalize_detections(self, detections: List[Dict]) -> List[Dict]:
         """
-        Crea un hash único a partir de las detecciones para cache.
+        Normaliza las detecciones para el cache (nombre y celda de posición).
         
         Args:
             detections: Lista de objetos detectados
             
         Returns:
-            Hash MD5 de las detecciones
+            Lista ordenada de {name, x_center, y_center} con posiciones en
+            celdas de 100 px
         """
         # Normalizar detecciones (solo nombres y posiciones aproximadas)
         normalized = []
@@ -70,10 +69,7 @@ class LanguageAgent:
         
         # Ordenar para consistencia
         normalized.sort(key=lambda x: (x['name'], x['x_center'], x['y_center']))
-        
-        # Crear hash
-        detections_str = json.dumps(normalized, sort_keys=True)
-        return hashlib.md5(detections_str.encode()).hexdigest()
+        return normalized
     
     def _build_prompt(self, detections: List[Dict], detailed: bool = False) -> str:
         """
@@ -171,8 +167,12 @@ Descripción:"""
         """
         # Verificar cache si está habilitado
         if use_cache and CACHE_DESCRIPTIONS and self.db_manager:
-            hash_detections = self._create_hash_from_detections(detections)
-            cached = self.db_manager.get_cached_description(hash_detections)
+            normalized = self._normalize_detections(detections)
+            hash_detections = DatabaseManager.compute_hash(normalized)
+            # Mismas tuplas que el hash: el cache semántico no debe reutilizar
+            # una descripción con los objetos en otras posiciones
+            labels = [f"{d['name']} x{d['x_center']} y{d['y_center']}" for d in normalized]
+            cached = self.db_manager.get_cached_description(hash_detections, labels)
             if cached:
                 logger.debug("Descripción obtenida del cache")
                 return cached
@@ -209,8 +209,7 @@ Descripción:"""
             
             # Guardar en cache si está habilitado
             if use_cache and CACHE_DESCRIPTIONS and self.db_manager:
-                hash_detections = self._create_hash_from_detections(detections)
-                self.db_manager.cache_description(hash_detections, description)
+                self.db_manager.cache_description(hash_detections, description, labels)
             
             logger.debug(f"Descripción generada: {description[:50]}...")
             return description
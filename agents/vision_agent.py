@@ -32,6 +32,8 @@ class VisionAgent:
         self.process_every_n_frames = YOLO_PROCESS_EVERY_N_FRAMES
         self.frame_count = 0
         self.model = None
+        self._names = []
+        self._names_lower = []
         self._load_model()
     
     def _load_model(self):
@@ -40,6 +42,10 @@ class VisionAgent:
             logger.info(f"Cargando modelo YOLO: {self.model_path}")
             self.model = YOLO(self.model_path)
             logger.info("Modelo YOLO cargado correctamente")
+            
+            # Nombres de clase indexados por class_id (lista en lugar de dict)
+            self._names = [self.model.names[i] for i in range(len(self.model.names))]
+            self._names_lower = [name.lower() for name in self._names]
         except Exception as e:
             logger.error(f"Error al cargar modelo YOLO: {e}")
             raise
@@ -69,17 +75,24 @@ class VisionAgent:
             return []
         
         try:
-            # Ejecutar detección
-            results = self.model(frame, conf=self.confidence_threshold, verbose=False)
+            # Obtener dimensiones del frame
+            frame_height, frame_width = frame.shape[:2]
+            
+            # Ejecutar detección (NMS acotado: luego solo se conservan 10)
+            results = self.model(
+                frame,
+                conf=self.confidence_threshold,
+                iou=0.5,
+                max_det=20,
+                agnostic_nms=True,
+                verbose=False
+            )
             
             detections = []
             
             if results and len(results) > 0:
                 result = results[0]
                 
-                # Obtener dimensiones del frame
-                frame_height, frame_width = frame.shape[:2]
-                
                 # Procesar cada detección
                 if result.boxes is not None:
                     for box in result.boxes:
@@ -89,7 +102,7 @@ class VisionAgent:
                         class_id = int(box.cls[0].cpu().numpy())
                         
                         # Obtener nombre de la clase
-                        class_name = self.model.names[class_id]
+                        class_name = self._names[class_id]
                         
                         # Calcular posición del centro
                         bbox_pos = calculate_bbox_position(
@@ -97,7 +110,7 @@ class VisionAgent:
                         )
                         
                         # Filtrar por relevancia (objetos comunes en entornos)
-                        if self._is_relevant_object(class_name, confidence):
+                        if self._is_relevant_object(self._names_lower[class_id], confidence):
                             detection = {
                                 'name': class_name,
                                 'confidence': confidence,
@@ -131,7 +144,7 @@ class VisionAgent:
         Determina si un objeto es relevante para el contexto de invidentes.
         
         Args:
-            class_name: Nombre de la clase detectada
+            class_name: Nombre de la clase detectada (en minúsculas)
             confidence: Nivel de confianza
             
         Returns:
@@ -151,14 +164,12 @@ class VisionAgent:
             'sandwich', 'pizza', 'clock', 'scissors', 'toothbrush'
         ]
         
-        class_lower = class_name.lower()
-        
         # Si está en alta prioridad, siempre incluirlo si confianza > 0.4
-        if class_lower in high_priority:
+        if class_name in high_priority:
             return confidence >= 0.4
         
         # Si está en media prioridad, requerir mayor confianza
-        if class_lower in medium_priority:
+        if class_name in medium_priority:
             return confidence >= 0.6
         
         # Otros objetos solo si confianza muy alta
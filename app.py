@@ -2,6 +2,7 @@
 Aplicación principal Streamlit para el sistema de asistencia visual.
 """
 
+import atexit
 import streamlit as st
 import cv2
 import numpy as np
@@ -10,11 +11,14 @@ import time
 from typing import Optional
 
 # Configuración de logging
-from utils.helpers import setup_logging, validate_camera_access, validate_ollama_connection
+from utils.helpers import (
+    setup_logging, validate_camera_access, validate_ollama_connection,
+    encode_frame_jpeg
+)
 from agents.vision_agent import VisionAgent
 from agents.language_agent import LanguageAgent
 from modules.audio_module import AudioManager
-from modules.database_manager import DatabaseManager
+from modules.database_manager import make_db
 from modules.audio_detector import AudioDetector
 from config import ENABLE_AUDIO_DETECTION
 from config import (
@@ -86,12 +90,25 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+@st.cache_resource
+def get_db_manager():
+    """
+    Crea el gestor de base de datos una sola vez por proceso.
+    
+    Todas las sesiones de Streamlit comparten su pool de conexiones; al
+    terminar el proceso se vacían los buffers y se cierra el pool.
+    """
+    db_manager = make_db()
+    atexit.register(db_manager.close)
+    return db_manager
+
+
 def initialize_components():
     """Inicializa todos los componentes del sistema."""
     if 'initialized' not in st.session_state:
         try:
             # Inicializar base de datos
-            st.session_state.db_manager = DatabaseManager()
+            st.session_state.db_manager = get_db_manager()
             logger.info("DatabaseManager inicializado")
             
             # Crear/obtener usuario por defecto
@@ -124,6 +141,8 @@ def initialize_components():
             st.session_state.last_detection_time = 0
             st.session_state.last_description = ""
             st.session_state.cap = None
+            st.session_state.last_shown_frame_id = None
+            st.session_state.last_frame_jpeg = None
             # NO inicializar frame_placeholder aquí, se crea en main()
             
             # Inicializar detector de audio si está habilitado
@@ -199,6 +218,11 @@ def start_detection():
         
         # Configurar propiedades de la cámara (después de abrir)
         try:
+            # Pedir formato sin comprimir (YUY2) para evitar decodificar MJPEG
+            # por software en cada cap.read(); si el driver no lo acepta, MJPEG
+            if not st.session_state.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'YUY2')):
+                logger.warning("La cámara no acepta YUY2, usando MJPEG")
+                st.session_state.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
             st.session_state.cap.set(cv2.CAP_PROP_FRAME_WIDTH, VIDEO_WIDTH)
             st.session_state.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, VIDEO_HEIGHT)
             st.session_state.cap.set(cv2.CAP_PROP_FPS, VIDEO_FPS)
@@ -294,12 +318,23 @@ def process_video_and_detection():
         if 'frame_placeholder' in st.session_state and st.session_state.frame_placeholder is not None:
             try:
                 if frame.size > 0:
-                    # Convertir BGR a RGB para Streamlit
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    # Identificador barato del frame (muestra dispersa de píxeles):
+                    # si la cámara no avanzó entre reruns se reutiliza la imagen
+                    # ya codificada en lugar de convertir y re-codificar
+                    frame_id = hash(frame[::32, ::32].tobytes())
+                    if frame_id != st.session_state.last_shown_frame_id:
+                        # Convertir BGR a RGB para Streamlit usando T-API (UMat):
+                        # OpenCL en GPU si está disponible, ruta vectorizada en CPU si no
+                        rgb_umat = cv2.cvtColor(cv2.UMat(frame), cv2.COLOR_BGR2RGB)
+                        frame_rgb = rgb_umat.get()
+                        st.session_state.last_frame_jpeg = encode_frame_jpeg(frame_rgb)
+                        st.session_state.last_shown_frame_id = frame_id
+                    
                     # Actualizar la imagen - video continuo
+                    # (Streamlit limpia el placeholder en cada rerun, así que
+                    # siempre se vuelve a emitir, pero con bytes ya codificados)
                     st.session_state.frame_placeholder.image(
-                        frame_rgb, 
-                        channels="RGB", 
+                        st.session_state.last_frame_jpeg,
                         width='stretch'
                     )
             except Exception as img_error:
@@ -327,6 +362,13 @@ def process_video_and_detection():
             
             # Combinar detecciones visuales con información de audio
             if detections or noise_info:
+                # Si hay audio en curso, saltar este ciclo antes de llamar a
+                # OLLAMA y sin bloquear el video; en 3 segundos habrá una
+                # detección nueva
+                if st.session_state.audio_manager.is_busy():
+                    st.session_state.last_detection_time = current_time
+                    return
+                
                 try:
                     detailed = st.session_state.user_preferences.get('modo_detallado', False)
                     
@@ -345,13 +387,7 @@ def process_video_and_detection():
                     )
                     
                     # Solo hablar si la descripción es diferente
-                    # Y esperar a que termine el audio actual antes de reproducir uno nuevo
                     if description != st.session_state.last_description:
-                        # Esperar a que termine el audio actual si está reproduciendo
-                        if st.session_state.audio_manager.is_busy():
-                            # Esperar un poco más antes de interrumpir
-                            time.sleep(0.5)
-                        
                         st.session_state.audio_manager.speak(description)
                         st.session_state.last_description = description
                         st.session_state.last_detection_time = current_time
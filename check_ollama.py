@@ -2,55 +2,129 @@
 Script de diagnóstico para verificar la instalación y conexión de OLLAMA.
 """
 
+import json
+import os
 import requests
+import shutil
 import sys
-import subprocess
+import time
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
-def check_ollama_installed():
-    """Verifica si OLLAMA está instalado."""
+# Parser JSON acelerado (orjson) si está instalado; stdlib como respaldo
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Sesión compartida: reutiliza conexiones TCP con OLLAMA entre llamadas.
+# Es un sondeo de salud: sin reintentos de conexión ni de lectura, para que
+# "OLLAMA no está corriendo" se informe al instante (el backoff largo vive
+# en download_ollama_model.py); solo reintenta una vez los 502/503/504
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=1,
+        connect=0,
+        read=0,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET", "POST"]
+    )
+))
+
+# Socket UNIX local de OLLAMA (OLLAMA_HOST=unix:///ruta): evita el handshake
+# y la pila TCP de loopback en cada sondeo; TCP en localhost como respaldo
+DEFAULT_SOCKET_PATH = '/tmp/ollama.sock'
+DEFAULT_BASE_URL = "http://localhost:11434"
+
+def _resolve_base_url():
+    """Devuelve la URL base de OLLAMA, vía socket UNIX si está disponible."""
+    host = os.getenv('OLLAMA_HOST', '')
+    socket_path = host[len('unix://'):] if host.startswith('unix://') else DEFAULT_SOCKET_PATH
+    if not os.path.exists(socket_path):
+        return DEFAULT_BASE_URL
     try:
-        result = subprocess.run(['ollama', '--version'], 
-                              capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            print(f"✅ OLLAMA está instalado: {result.stdout.strip()}")
-            return True
-        else:
-            print("❌ OLLAMA no está instalado correctamente")
-            return False
-    except FileNotFoundError:
-        print("❌ OLLAMA no está instalado o no está en el PATH")
-        return False
-    except Exception as e:
-        print(f"❌ Error al verificar OLLAMA: {e}")
-        return False
+        import requests_unixsocket
+    except ImportError:
+        return DEFAULT_BASE_URL
+    SESSION.mount("http+unix://", requests_unixsocket.UnixAdapter())
+    return f"http+unix://{quote(socket_path, safe='')}"
+
+BASE_URL = _resolve_base_url()
 
-def check_ollama_running(base_url="http://localhost:11434"):
-    """Verifica si OLLAMA está corriendo."""
+# Cache en memoria de /api/tags: base_url -> (timestamp, (status_code, json))
+HEALTH_TTL = float(os.getenv('OLLAMA_HEALTH_TTL', '5'))
+_HEALTH_CACHE = {}
+
+def check_ollama_installed():
+    """Verifica si OLLAMA está instalado (binario en el PATH, sin lanzar procesos)."""
+    path = shutil.which('ollama')
+    if path:
+        print(f"✅ OLLAMA está instalado: {path}")
+        return True
+    print("❌ OLLAMA no está instalado o no está en el PATH")
+    return False
+
+def fetch_tags(base_url=BASE_URL, force=False):
+    """
+    Consulta /api/tags una sola vez; sirve para saber si OLLAMA está corriendo
+    y qué modelos tiene. Las respuestas se cachean HEALTH_TTL segundos.
+    
+    Args:
+        base_url: URL base de OLLAMA
+        force: Si es True, ignora el cache y consulta al servidor
+    
+    Returns:
+        Tuple (status_code, json o None); status_code es None si no hubo respuesta
+    """
+    now = time.monotonic()
+    cached = _HEALTH_CACHE.get(base_url)
+    if not force and cached and now - cached[0] < HEALTH_TTL:
+        return cached[1]
+    
     try:
-        response = requests.get(f"{base_url}/api/tags", timeout=5)
-        if response.status_code == 200:
-            print(f"✅ OLLAMA está corriendo en {base_url}")
-            return True
-        else:
-            print(f"⚠️ OLLAMA respondió con código {response.status_code}")
-            return False
-    except requests.exceptions.ConnectionError:
+        response = SESSION.get(f"{base_url}/api/tags", timeout=5)
+    except requests.exceptions.RequestException:
+        # No cachear fallos de conexión: OLLAMA puede estar arrancando
+        return None, None
+    
+    data = None
+    if response.status_code == 200:
+        try:
+            data = json_loads(response.content)
+        except ValueError:
+            pass
+    
+    result = (response.status_code, data)
+    _HEALTH_CACHE[base_url] = (now, result)
+    return result
+
+def check_ollama_running(base_url=BASE_URL, tags=None):
+    """Verifica si OLLAMA está corriendo (reutiliza `tags` de fetch_tags si se pasa)."""
+    status_code, _ = tags if tags is not None else fetch_tags(base_url)
+    
+    if status_code == 200:
+        print(f"✅ OLLAMA está corriendo en {base_url}")
+        return True
+    elif status_code is not None:
+        print(f"⚠️ OLLAMA respondió con código {status_code}")
+        return False
+    else:
         print(f"❌ No se pudo conectar a OLLAMA en {base_url}")
         print("   Asegúrate de que OLLAMA esté corriendo: ollama serve")
         return False
-    except requests.exceptions.Timeout:
-        print(f"❌ Timeout al conectar con OLLAMA en {base_url}")
-        return False
-    except Exception as e:
-        print(f"❌ Error al verificar OLLAMA: {e}")
-        return False
 
-def check_ollama_models(base_url="http://localhost:11434", model="llama3"):
-    """Verifica si el modelo está disponible."""
+def check_ollama_models(base_url=BASE_URL, model="llama3", tags=None):
+    """Verifica si el modelo está disponible (reutiliza `tags` de fetch_tags si se pasa)."""
     try:
-        response = requests.get(f"{base_url}/api/tags", timeout=5)
-        if response.status_code == 200:
-            models = response.json().get('models', [])
+        status_code, data = tags if tags is not None else fetch_tags(base_url)
+        if status_code == 200 and data is not None:
+            models = data.get('models', [])
             model_names = [m.get('name', '') for m in models]
             
             print(f"\n📦 Modelos disponibles en OLLAMA:")
@@ -60,8 +134,10 @@ def check_ollama_models(base_url="http://localhost:11434", model="llama3"):
             else:
                 print("   (ningún modelo instalado)")
             
-            # Verificar si el modelo específico está disponible
-            if any(model in m for m in model_names):
+            # Verificar si el modelo específico está disponible: primero por
+            # nombre exacto (sin tag) y solo si falla por subcadena
+            base_names = {m.split(':')[0] for m in model_names}
+            if model in base_names or any(model in m for m in model_names):
                 print(f"\n✅ Modelo '{model}' está disponible")
                 return True
             else:
@@ -78,19 +154,24 @@ def main():
     """Ejecuta todas las verificaciones."""
     print("🔍 Verificando OLLAMA...\n")
     
-    # Verificar instalación
-    installed = check_ollama_installed()
-    print()
+    # Consultar primero /api/tags: si responde, OLLAMA está instalado y
+    # corriendo, y la misma respuesta sirve para verificar los modelos
+    tags = fetch_tags()
     
-    if not installed:
-        print("\n📥 Para instalar OLLAMA:")
-        print("   1. Visita: https://ollama.ai")
-        print("   2. Descarga e instala OLLAMA para tu sistema operativo")
-        print("   3. Reinicia la terminal después de instalar")
-        return False
+    # Verificar instalación solo si el servicio no respondió
+    if tags[0] is None:
+        installed = check_ollama_installed()
+        print()
+        
+        if not installed:
+            print("\n📥 Para instalar OLLAMA:")
+            print("   1. Visita: https://ollama.ai")
+            print("   2. Descarga e instala OLLAMA para tu sistema operativo")
+            print("   3. Reinicia la terminal después de instalar")
+            return False
     
     # Verificar si está corriendo
-    running = check_ollama_running()
+    running = check_ollama_running(tags=tags)
     print()
     
     if not running:
@@ -100,7 +181,7 @@ def main():
         return False
     
     # Verificar modelos
-    models_ok = check_ollama_models()
+    models_ok = check_ollama_models(tags=tags)
     print()
     
     if not models_ok:
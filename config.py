@@ -2,11 +2,66 @@
 Configuración centralizada del sistema de asistencia visual.
 """
 
+import json
 import os
-from dotenv import load_dotenv
+from dotenv import dotenv_values, find_dotenv
+from dotenv.variables import parse_variables
+
+
+def _load_env():
+    """
+    Carga las variables de .env sin sobrescribir las ya definidas.
+    
+    Los valores parseados (sin expandir ${VAR}) se guardan en `.env.cache`
+    junto al .env y se reutilizan mientras su mtime no cambie, evitando
+    volver a tokenizar el archivo en cada script que importa config.
+    """
+    env_path = find_dotenv()
+    if not env_path:
+        return
+    
+    cache_path = env_path + '.cache'
+    mtime = os.stat(env_path).st_mtime
+    values = None
+    
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            # Una cache legible por otros usuarios se descarta y se reescribe
+            if os.name != 'posix' or not os.fstat(f.fileno()).st_mode & 0o077:
+                cached = json.load(f)
+                if cached.get('mtime') == mtime and cached.get('raw'):
+                    values = cached.get('values')
+    except (OSError, ValueError):
+        pass
+    
+    if values is None:
+        values = {
+            k: v for k, v in dotenv_values(env_path, interpolate=False).items()
+            if v is not None
+        }
+        try:
+            # Contiene los mismos secretos que .env: solo legible por el dueño
+            fd = os.open(cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                if hasattr(os, 'fchmod'):
+                    os.fchmod(fd, 0o600)
+                json.dump({'mtime': mtime, 'raw': True, 'values': values}, f)
+        except OSError:
+            pass
+    
+    # Igual que load_dotenv(): el entorno real tiene prioridad sobre .env,
+    # también al expandir ${VAR} (se hace en cada carga, no en la cache)
+    expanded = {}
+    for key, value in values.items():
+        if '${' in value:
+            env = {**expanded, **os.environ}
+            value = ''.join(atom.resolve(env) for atom in parse_variables(value))
+        expanded[key] = value
+        os.environ.setdefault(key, value)
+
 
 # Cargar variables de entorno
-load_dotenv()
+_load_env()
 
 # Configuración de OLLAMA
 OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
@@ -43,6 +98,11 @@ if not DATABASE_URL and not (SUPABASE_URL and SUPABASE_KEY):
 # Determinar método de conexión
 USE_SUPABASE_CLIENT = bool(SUPABASE_URL and SUPABASE_KEY)
 
+# Pool de conexiones PostgreSQL (conexiones mantenidas / máximas)
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '5'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '25'))
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))  # Segundos antes de cerrar una conexión ociosa
+
 # Configuración de YOLO
 YOLO_MODEL = os.getenv('YOLO_MODEL', 'yolov8n.pt')
 YOLO_CONFIDENCE_THRESHOLD = float(os.getenv('YOLO_CONFIDENCE_THRESHOLD', '0.5'))
@@ -64,10 +124,18 @@ VIDEO_FPS = int(os.getenv('VIDEO_FPS', '30'))
 MAX_DESCRIPTION_LENGTH = int(os.getenv('MAX_DESCRIPTION_LENGTH', '500'))  # Aumentado para descripciones completas
 AUDIO_QUEUE_MAX_SIZE = int(os.getenv('AUDIO_QUEUE_MAX_SIZE', '3'))
 CACHE_DESCRIPTIONS = os.getenv('CACHE_DESCRIPTIONS', 'true').lower() == 'true'
+LOCAL_CACHE_PATH = os.getenv('LOCAL_CACHE_PATH', 'cache.db')  # SQLite local delante de la BD; vacío = desactivado
+
+# Cache semántico (solo PostgreSQL directo con pgvector): reutiliza descripciones
+# de conjuntos de objetos parecidos, no solo idénticos
+SEMANTIC_CACHE = os.getenv('SEMANTIC_CACHE', 'false').lower() == 'true'
+SEMANTIC_CACHE_MODEL = os.getenv('SEMANTIC_CACHE_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+SEMANTIC_CACHE_MAX_DISTANCE = float(os.getenv('SEMANTIC_CACHE_MAX_DISTANCE', '0.05'))  # Distancia coseno máxima
 
 # Configuración de detección de audio/ruido
 AUDIO_SAMPLE_RATE = int(os.getenv('AUDIO_SAMPLE_RATE', '44100'))
-AUDIO_CHUNK_SIZE = int(os.getenv('AUDIO_CHUNK_SIZE', '1024'))
+AUDIO_CHUNK_SIZE = int(os.getenv('AUDIO_CHUNK_SIZE', '0'))  # 0 = ajustar al periodo del dispositivo
+AUDIO_DECIMATION = int(os.getenv('AUDIO_DECIMATION', '4'))  # Usar 1 de cada N muestras para medir el nivel
 NOISE_THRESHOLD = float(os.getenv('NOISE_THRESHOLD', '0.2'))  # Umbral para considerar ruido significativo
 ENABLE_AUDIO_DETECTION = os.getenv('ENABLE_AUDIO_DETECTION', 'true').lower() == 'true'
 
@@ -4,34 +4,116 @@ Script para descargar el modelo de OLLAMA usando la API directamente.
 
 import requests
 import json
+import random
+import socket
 import time
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util import Retry
+
+# Parser JSON acelerado (orjson) si está instalado; stdlib como respaldo
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+class TunedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter con buffer de recepción de 1 MiB (además de TCP_NODELAY)."""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        # default_socket_options ya incluye TCP_NODELAY
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20),
+        ]
+        super().init_poolmanager(*args, **kwargs)
+
+# Sesión compartida: reutiliza conexiones TCP con OLLAMA entre llamadas.
+# Sin reintentos de conexión ni de lectura: verify_model falla al instante
+# si OLLAMA no corre, y el pull ya reintenta con su propio backoff
+# (PULL_ATTEMPTS); aquí solo se reintentan los 502/503/504
+SESSION = requests.Session()
+SESSION.mount("http://", TunedHTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=5,
+        connect=0,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET", "POST"]
+    )
+))
+
+# Reintentos de la descarga completa (la API de pull reanuda lo ya descargado)
+PULL_ATTEMPTS = 5
+
+# Tamaño de lectura del stream de progreso
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# (conexión, lectura): un stream detenido se detecta en 30 s y se reintenta
+PULL_TIMEOUT = (5, 30)
+
+def iter_ndjson_lines(response, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Itera las líneas completas de una respuesta NDJSON.
+    
+    Lee bloques grandes con iter_content y los separa por saltos de línea,
+    en lugar del escaneo en trozos pequeños de iter_lines().
+    """
+    pending = b""
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if not chunk:
+            continue
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line:
+                yield line
+    if pending.strip():
+        yield pending
 
 def download_model(model_name="llama3"):
-    """Descarga un modelo de OLLAMA usando la API."""
+    """
+    Descarga un modelo de OLLAMA usando la API.
+    
+    Returns:
+        True solo si el stream de pull terminó con estado "success"
+        (lo que ya confirma que el modelo quedó instalado)
+    """
     base_url = "http://localhost:11434"
     
     print(f"📥 Descargando modelo '{model_name}'...")
     print("   Esto puede tardar varios minutos (el modelo es ~4.7GB)\n")
     
-    try:
-        # Iniciar descarga
-        response = requests.post(
-            f"{base_url}/api/pull",
-            json={"name": model_name},
-            stream=True,
-            timeout=300
-        )
-        
-        if response.status_code != 200:
-            print(f"❌ Error al iniciar descarga: {response.status_code}")
-            return False
+    for attempt in range(PULL_ATTEMPTS):
+        if attempt:
+            # Backoff exponencial con jitter antes de reintentar
+            delay = min(2 ** attempt, 30) + random.random()
+            print(f"   🔁 Reintentando en {delay:.1f}s (intento {attempt + 1}/{PULL_ATTEMPTS})...")
+            time.sleep(delay)
         
-        # Procesar respuesta stream
-        print("Progreso:")
-        for line in response.iter_lines():
-            if line:
+        try:
+            # Iniciar descarga
+            response = SESSION.post(
+                f"{base_url}/api/pull",
+                json={"name": model_name},
+                headers={"Accept-Encoding": "identity"},
+                stream=True,
+                timeout=PULL_TIMEOUT
+            )
+            
+            if response.status_code != 200:
+                print(f"❌ Error al iniciar descarga: {response.status_code}")
+                return False
+            
+            # Procesar respuesta stream
+            print("Progreso:")
+            pulled = False
+            for line in iter_ndjson_lines(response):
                 try:
-                    data = json.loads(line)
+                    data = json_loads(line)
                     
                     if 'status' in data:
                         status = data.get('status', '')
@@ -41,6 +123,7 @@ def download_model(model_name="llama3"):
                             print(f"   {status}")
                         elif 'complete' in status.lower() or 'success' in status.lower():
                             print(f"   ✅ {status}")
+                            pulled = 'success' in status.lower()
                             break
                     
                     if 'error' in data:
@@ -49,30 +132,40 @@ def download_model(model_name="llama3"):
                         
                 except json.JSONDecodeError:
                     continue
-        
-        print(f"\n✅ Modelo '{model_name}' descargado correctamente!")
-        return True
-        
-    except requests.exceptions.ConnectionError:
-        print("❌ No se pudo conectar a OLLAMA")
-        print("   Asegúrate de que OLLAMA esté corriendo")
-        return False
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        return False
+            
+            if pulled:
+                print(f"\n✅ Modelo '{model_name}' descargado correctamente!")
+            else:
+                print(f"\n⚠️ La descarga de '{model_name}' terminó sin confirmar éxito")
+            return pulled
+            
+        except requests.exceptions.Timeout:
+            print("❌ OLLAMA dejó de responder durante la descarga")
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            # También cubre un ReadTimeout a mitad del stream (iter_content
+            # lo reporta como ConnectionError)
+            print("❌ No se pudo conectar a OLLAMA")
+            print("   Asegúrate de que OLLAMA esté corriendo")
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            return False
+    
+    return False
 
 def verify_model(model_name="llama3"):
     """Verifica si el modelo está disponible."""
     base_url = "http://localhost:11434"
     
     try:
-        response = requests.get(f"{base_url}/api/tags", timeout=5)
+        response = SESSION.get(f"{base_url}/api/tags", timeout=5)
         if response.status_code == 200:
-            data = response.json()
+            data = json_loads(response.content)
             models = data.get('models', [])
             model_names = [m.get('name', '') for m in models]
             
-            if any(model_name in name for name in model_names):
+            # Búsqueda exacta por nombre (sin tag) antes de la de subcadena
+            base_names = {name.split(':')[0] for name in model_names}
+            if model_name in base_names or any(model_name in name for name in model_names):
                 return True
         return False
     except:
@@ -88,11 +181,9 @@ if __name__ == "__main__":
         print("   Puedes ejecutar la aplicación ahora.")
     else:
         print(f"📥 El modelo '{model}' no está instalado.\n")
-        download_model(model)
-        
-        # Verificar después de descargar
-        print("\n🔍 Verificando instalación...")
-        if verify_model(model):
+        # El estado "success" del stream ya confirma la instalación,
+        # sin otra consulta a /api/tags
+        if download_model(model):
             print("✅ ¡Modelo instalado correctamente!")
             print("   Puedes ejecutar la aplicación ahora.")
         else:
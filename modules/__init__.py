@@ -1,9 +1,29 @@
 """
 Módulos core del sistema: audio y base de datos.
+
+Las clases se importan de forma diferida (PEP 562) para que `import modules`
+no arrastre pyaudio/psycopg2/supabase si solo se usa una de ellas.
 """
 
-from .audio_module import AudioManager
-from .database_manager import DatabaseManager
+import importlib
+
+_LAZY = {
+    'AudioManager': '.audio_module',
+    'DatabaseManager': '.database_manager',
+    'make_db': '.database_manager',
+}
+
+__all__ = ['AudioManager', 'DatabaseManager', 'make_db']
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        module = importlib.import_module(_LAZY[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-__all__ = ['AudioManager', 'DatabaseManager']
 
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -3,11 +3,12 @@ Módulo para detectar ruido y sonidos en el entorno.
 """
 
 import logging
+import math
 import numpy as np
 import pyaudio
 import time
-from typing import Dict, Optional
-from config import AUDIO_SAMPLE_RATE, AUDIO_CHUNK_SIZE, NOISE_THRESHOLD
+from typing import Dict, Optional, Tuple
+from config import AUDIO_SAMPLE_RATE, AUDIO_CHUNK_SIZE, AUDIO_DECIMATION, NOISE_THRESHOLD
 
 logger = logging.getLogger(__name__)
 
@@ -15,25 +16,83 @@ logger = logging.getLogger(__name__)
 class AudioDetector:
     """Detector de ruido y sonidos ambientales."""
     
+    # Tamaño de bloque si no se puede consultar el dispositivo
+    DEFAULT_CHUNK_SIZE = 1024
+    
+    # Límites (RMS normalizado) entre niveles de ruido y sus descripciones
+    _THR = np.array([0.3, 0.5, 0.7])
+    _LVL = ("bajo", "moderado", "alto", "muy alto")
+    _DESCRIPTIONS = tuple(f"Se detecta ruido {level} en el entorno" for level in _LVL)
+    
     def __init__(self):
         """Inicializa el detector de audio."""
         self.audio = None
         self.stream = None
         self.sample_rate = AUDIO_SAMPLE_RATE
-        self.chunk_size = AUDIO_CHUNK_SIZE
+        # AUDIO_CHUNK_SIZE=0 -> ajustar al periodo del hardware al abrir el stream
+        self._auto_chunk_size = AUDIO_CHUNK_SIZE <= 0
+        self.chunk_size = AUDIO_CHUNK_SIZE if AUDIO_CHUNK_SIZE > 0 else self.DEFAULT_CHUNK_SIZE
         self.noise_threshold = NOISE_THRESHOLD
+        self.decimation = max(1, AUDIO_DECIMATION)
         self.is_listening = False
+        # Energía del último bloque, actualizada por el callback de PortAudio
+        self._latest_sumsq = None
+        self._configure_buffers()
+    
+    def _configure_buffers(self):
+        """Precalcula umbrales y buffers para el tamaño de bloque actual."""
+        # Muestras usadas por bloque tras diezmar (para un umbral de ruido
+        # basta con ~11 kHz; menos datos que recorrer en cada bloque)
+        n = len(range(0, self.chunk_size, self.decimation))
+        self._n_samples = n
+        
+        # Umbrales precalculados en el dominio de la suma de cuadrados
+        # (sum(x²) > (umbral * 32768)² * N  <=>  rms normalizado > umbral),
+        # así la ruta común no necesita sqrt ni división
+        self._sumsq_threshold = (self.noise_threshold * 32768.0) ** 2 * n
+        self._lvl_thresholds = (self._THR * 32768.0) ** 2 * n
         
+        # Buffer float32 persistente para no reservar memoria en cada bloque
+        self._fbuf = np.empty(n, dtype=np.float32)
+    
+    def _hardware_chunk_size(self) -> int:
+        """
+        Calcula un tamaño de bloque acorde al periodo del dispositivo de entrada.
+        
+        Returns:
+            Potencia de 2 más cercana (por arriba) a latencia_baja * sample_rate
+        """
+        try:
+            info = self.audio.get_default_input_device_info()
+            frames = info['defaultLowInputLatency'] * self.sample_rate
+            if frames <= 0:
+                return self.DEFAULT_CHUNK_SIZE
+            return 1 << max(0, math.ceil(math.log2(frames)))
+        except Exception as e:
+            logger.warning(f"No se pudo consultar la latencia del dispositivo: {e}")
+            return self.DEFAULT_CHUNK_SIZE
+    
     def start_listening(self):
         """Inicia la captura de audio."""
         try:
             self.audio = pyaudio.PyAudio()
+            
+            # Alinear frames_per_buffer con el periodo del hardware evita
+            # re-empaquetados y copias extra dentro de PortAudio
+            if self._auto_chunk_size:
+                self.chunk_size = self._hardware_chunk_size()
+                self._configure_buffers()
+            logger.info(f"Tamaño de bloque de audio: {self.chunk_size} muestras")
+            
             self.stream = self.audio.open(
                 format=pyaudio.paInt16,
                 channels=1,
                 rate=self.sample_rate,
                 input=True,
-                frames_per_buffer=self.chunk_size
+                frames_per_buffer=self.chunk_size,
+                # Modo callback: PortAudio entrega cada bloque desde su propio
+                # hilo de IO; nadie bloquea en stream.read()
+                stream_callback=self._audio_cb
             )
             self.is_listening = True
             logger.info("Detector de audio iniciado")
@@ -51,55 +110,109 @@ class AudioDetector:
             if self.audio:
                 self.audio.terminate()
             self.is_listening = False
+            self._latest_sumsq = None
             logger.info("Detector de audio detenido")
         except Exception as e:
             logger.error(f"Error al detener detector de audio: {e}")
     
-    def detect_noise(self) -> Optional[Dict]:
+    def _audio_cb(self, in_data, frame_count, time_info, status):
+        """Callback de PortAudio: guarda la energía del bloque recibido."""
+        try:
+            self._latest_sumsq = self._sumsq(in_data)
+        except Exception as e:
+            logger.error(f"Error al procesar bloque de audio: {e}")
+        return (None, pyaudio.paContinue)
+    
+    def _sumsq(self, data: bytes) -> float:
         """
-        Detecta ruido en el audio capturado.
+        Calcula la suma de cuadrados de un bloque de audio int16.
+        
+        Las muestras (diezmadas) se copian al buffer float32 persistente
+        y el producto punto suma los cuadrados en una sola pasada, sin el
+        temporal de `x**2` (que además desborda en int16).
         
+        Args:
+            data: Bytes crudos leídos del stream
+            
         Returns:
-            Diccionario con información del ruido detectado o None si no hay ruido significativo
+            Suma de los cuadrados de las muestras
+        """
+        np.copyto(self._fbuf, np.frombuffer(data, dtype=np.int16)[::self.decimation])
+        return float(np.dot(self._fbuf, self._fbuf))
+    
+    def _compute(self) -> Optional[Tuple[float, float]]:
+        """
+        Lee una sola vez la energía del último bloque capturado.
+        
+        Returns:
+            Tuple (suma de cuadrados, nivel normalizado 0-1) o None si no hay audio
         """
         if not self.is_listening or not self.stream:
             return None
         
-        try:
-            # Leer datos de audio
-            data = self.stream.read(self.chunk_size, exception_on_overflow=False)
-            
-            # Convertir a array numpy
-            audio_data = np.frombuffer(data, dtype=np.int16)
-            
-            # Calcular nivel de ruido (RMS - Root Mean Square)
-            rms = np.sqrt(np.mean(audio_data**2))
-            
-            # Normalizar a escala 0-1
-            max_value = 32768.0  # Valor máximo para int16
-            normalized_rms = rms / max_value
-            
-            # Determinar si hay ruido significativo
-            if normalized_rms > self.noise_threshold:
-                # Clasificar nivel de ruido
-                if normalized_rms > 0.7:
-                    level = "muy alto"
-                elif normalized_rms > 0.5:
-                    level = "alto"
-                elif normalized_rms > 0.3:
-                    level = "moderado"
-                else:
-                    level = "bajo"
-                
-                return {
-                    'has_noise': True,
-                    'level': level,
-                    'intensity': float(normalized_rms),
-                    'description': f"Se detecta ruido {level} en el entorno"
-                }
-            
+        # Energía ya calculada por el callback: aquí nunca se bloquea
+        sumsq = self._latest_sumsq
+        if sumsq is None:
             return None
+        
+        level = min(math.sqrt(sumsq / self._n_samples) / 32768.0, 1.0)
+        return sumsq, level
+    
+    def _classify(self, sumsq: float, level: float) -> Optional[Dict]:
+        """
+        Clasifica el ruido de un bloque ya medido.
+        
+        Args:
+            sumsq: Suma de cuadrados del bloque
+            level: Nivel normalizado (0-1) del mismo bloque
             
+        Returns:
+            Diccionario con información del ruido o None si no es significativo
+        """
+        # Determinar si hay ruido significativo
+        if sumsq <= self._sumsq_threshold:
+            return None
+        
+        # Clasificar nivel de ruido sin cascada de ifs: índice del
+        # primer límite >= sumsq (equivale a contar los límites superados)
+        idx = int(np.searchsorted(self._lvl_thresholds, sumsq))
+        
+        return {
+            'has_noise': True,
+            'level': self._LVL[idx],
+            'intensity': float(level),
+            'description': self._DESCRIPTIONS[idx]
+        }
+    
+    def sample(self) -> Tuple[float, Optional[Dict]]:
+        """
+        Obtiene nivel y clasificación del mismo bloque de audio.
+        
+        Returns:
+            Tuple (nivel normalizado 0-1, información de ruido o None)
+        """
+        try:
+            computed = self._compute()
+            if computed is None:
+                return 0.0, None
+            sumsq, level = computed
+            return level, self._classify(sumsq, level)
+        except Exception as e:
+            logger.error(f"Error al muestrear audio: {e}")
+            return 0.0, None
+    
+    def detect_noise(self) -> Optional[Dict]:
+        """
+        Detecta ruido en el audio capturado.
+        
+        Returns:
+            Diccionario con información del ruido detectado o None si no hay ruido significativo
+        """
+        try:
+            computed = self._compute()
+            if computed is None:
+                return None
+            return self._classify(*computed)
         except Exception as e:
             logger.error(f"Error al detectar ruido: {e}")
             return None
@@ -111,14 +224,8 @@ class AudioDetector:
         Returns:
             Nivel de audio normalizado (0-1)
         """
-        if not self.is_listening or not self.stream:
-            return 0.0
-        
         try:
-            data = self.stream.read(self.chunk_size, exception_on_overflow=False)
-            audio_data = np.frombuffer(data, dtype=np.int16)
-            rms = np.sqrt(np.mean(audio_data**2))
-            return min(rms / 32768.0, 1.0)
+            computed = self._compute()
+            return computed[1] if computed else 0.0
         except:
             return 0.0
-
@@ -1,18 +1,36 @@
 """
 Gestión de base de datos PostgreSQL/Supabase para perfiles de usuario,
 historial de detecciones y cache de descripciones.
-Soporta conexión directa PostgreSQL y cliente Supabase (Project URL + API Key).
+Soporta conexión directa PostgreSQL (DatabaseManagerPg) y cliente Supabase
+(DatabaseManagerSupabase, Project URL + API Key); make_db() elige según la configuración.
 """
 
 import logging
+import hashlib
 import json
-from typing import Dict, List, Optional
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from itertools import combinations
+from typing import Callable, Dict, List, Optional, Tuple
 from config import (
-    DATABASE_URL, SUPABASE_URL, SUPABASE_KEY, USE_SUPABASE_CLIENT, LOG_LEVEL
+    DATABASE_URL, SUPABASE_URL, SUPABASE_KEY, USE_SUPABASE_CLIENT, LOG_LEVEL,
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_MAX_IDLE, LOCAL_CACHE_PATH,
+    SEMANTIC_CACHE, SEMANTIC_CACHE_MODEL, SEMANTIC_CACHE_MAX_DISTANCE
 )
 
 logger = logging.getLogger(__name__)
 
+# Hash rápido no criptográfico (xxh3_128) si está instalado; MD5 como respaldo.
+# Ambos producen 32 caracteres hexadecimales
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
 # Importar según el método de conexión
 if USE_SUPABASE_CLIENT:
     try:
@@ -24,40 +42,499 @@ if USE_SUPABASE_CLIENT:
 else:
     SUPABASE_AVAILABLE = False
     import psycopg2
-    from psycopg2 import pool
-    from psycopg2.extras import RealDictCursor
+    from psycopg2 import extensions, pool
+    from psycopg2.extras import execute_values
     import urllib.parse as urlparse
 
+# Embeddings para el cache semántico (solo si está habilitado)
+SENTENCE_TRANSFORMERS_AVAILABLE = False
+if SEMANTIC_CACHE and not USE_SUPABASE_CLIENT:
+    try:
+        from sentence_transformers import SentenceTransformer
+        SENTENCE_TRANSFORMERS_AVAILABLE = True
+    except ImportError:
+        logger.warning("sentence-transformers no disponible. Instala: pip install sentence-transformers")
+
+# Columnas de usuarios leídas explícitamente (cursor de tuplas, sin dict por fila)
+_USER_COLUMNS = (
+    'id', 'nombre', 'preferencias_tts', 'velocidad_habla', 'volumen',
+    'modo_detallado', 'created_at', 'updated_at'
+)
+_USER_COLUMNS_SQL = ', '.join(_USER_COLUMNS)
+
+# Esquema completo; se envía en una sola petición al crear las tablas
+_SCHEMA_SQL = """
+    -- Tabla de usuarios/perfiles
+    CREATE TABLE IF NOT EXISTS usuarios (
+        id SERIAL PRIMARY KEY,
+        nombre VARCHAR(100) UNIQUE,
+        preferencias_tts JSONB DEFAULT '{}',
+        velocidad_habla INTEGER DEFAULT 150,
+        volumen REAL DEFAULT 0.8,
+        modo_detallado BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    -- Tabla de historial de detecciones
+    CREATE TABLE IF NOT EXISTS detecciones (
+        id SERIAL PRIMARY KEY,
+        usuario_id INTEGER REFERENCES usuarios(id),
+        objetos_detectados JSONB,
+        descripcion_generada TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    -- Tabla de cache de descripciones
+    CREATE TABLE IF NOT EXISTS cache_descripciones (
+        id SERIAL PRIMARY KEY,
+        hash_objetos VARCHAR(32) UNIQUE,
+        descripcion TEXT,
+        uso_count INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    -- Reducir la columna de tablas antiguas (VARCHAR(64)) al tamaño del hash,
+    -- solo si ningún valor existente la excede
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'cache_descripciones'
+              AND column_name = 'hash_objetos'
+              AND character_maximum_length <> 32
+        ) AND NOT EXISTS (
+            SELECT 1 FROM cache_descripciones WHERE length(hash_objetos) > 32
+        ) THEN
+            ALTER TABLE cache_descripciones ALTER COLUMN hash_objetos TYPE VARCHAR(32);
+        END IF;
+    END $$;
+    
+    -- Índices para optimización
+    CREATE INDEX IF NOT EXISTS idx_detecciones_usuario ON detecciones(usuario_id);
+    CREATE INDEX IF NOT EXISTS idx_detecciones_timestamp ON detecciones(timestamp DESC);
+    CREATE INDEX IF NOT EXISTS idx_cache_hash ON cache_descripciones(hash_objetos);
+"""
+
+# UPSERT en lote del cache de descripciones (sin / con embedding semántico)
+_CACHE_UPSERT_SQL = """
+    INSERT INTO cache_descripciones (hash_objetos, descripcion)
+    VALUES %s
+    ON CONFLICT (hash_objetos) 
+    DO UPDATE SET 
+        descripcion = EXCLUDED.descripcion,
+        uso_count = cache_descripciones.uso_count + 1,
+        last_used = CURRENT_TIMESTAMP
+"""
+_CACHE_UPSERT_EMBEDDING_SQL = """
+    INSERT INTO cache_descripciones (hash_objetos, descripcion, embedding)
+    VALUES %s
+    ON CONFLICT (hash_objetos) 
+    DO UPDATE SET 
+        descripcion = EXCLUDED.descripcion,
+        embedding = COALESCE(EXCLUDED.embedding, cache_descripciones.embedding),
+        uso_count = cache_descripciones.uso_count + 1,
+        last_used = CURRENT_TIMESTAMP
+"""
+
+# Preferencias actualizables y un UPDATE precalculado por cada combinación
+# de claves (2^4 - 1): conjunto de claves -> (columnas en orden, SQL)
+_PREFERENCE_COLUMNS = ('velocidad_habla', 'volumen', 'modo_detallado', 'preferencias_tts')
+_PREFERENCE_KEYS = frozenset(_PREFERENCE_COLUMNS)
+_UPDATE_TEMPLATES = {
+    frozenset(columns): (
+        columns,
+        "UPDATE usuarios SET "
+        + ", ".join(f"{column} = %s" for column in columns)
+        + ", updated_at = CURRENT_TIMESTAMP WHERE id = %s"
+    )
+    for size in range(1, len(_PREFERENCE_COLUMNS) + 1)
+    for columns in combinations(_PREFERENCE_COLUMNS, size)
+}
+
+
+class _BatchWriter:
+    """Acumula escrituras en memoria y las envía en lote por tamaño o por tiempo."""
+    
+    def __init__(self, flush_fn: Callable[[List[Tuple]], bool], max_size: int, interval: float):
+        """
+        Args:
+            flush_fn: Función que escribe una lista de filas de una vez
+            max_size: Filas pendientes que disparan el envío inmediato
+            interval: Segundos máximos que una fila espera en el buffer
+        """
+        self._flush_fn = flush_fn
+        self.max_size = max_size
+        self.interval = interval
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._timer = None
+    
+    def add(self, row: Tuple) -> bool:
+        """Encola una fila; devuelve False solo si un envío inmediato falla."""
+        self._buffer.append(row)
+        
+        if len(self._buffer) >= self.max_size:
+            return self.flush()
+        
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return True
+    
+    def flush(self) -> bool:
+        """
+        Escribe las filas pendientes.
+        
+        Returns:
+            True si no había pendientes o se guardaron correctamente
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            rows = []
+            while self._buffer:
+                rows.append(self._buffer.popleft())
+        
+        if not rows:
+            return True
+        return self._flush_fn(rows)
+
 
-class DatabaseManager:
-    """Gestor de conexiones y operaciones con PostgreSQL/Supabase."""
+class DatabaseManager(ABC):
+    """
+    Interfaz común de los gestores de base de datos.
+    
+    Incluye los niveles de cache compartidos (LRU en memoria y SQLite local);
+    cada backend implementa las operaciones y el último nivel del cache.
+    """
+    
+    # Entradas del LRU en memoria delante de get_cached_description
+    DESC_CACHE_MAX = 1024
     
     def __init__(self):
-        """Inicializa la conexión y crea las tablas si no existen."""
-        self.supabase_client = None
+        """Inicializa los niveles de cache locales."""
+        self._desc_cache = OrderedDict()
+        self._desc_cache_lock = threading.Lock()
+        self._local_cache = None
+        self._local_cache_lock = threading.Lock()
+        
+        if LOCAL_CACHE_PATH:
+            self._initialize_local_cache(LOCAL_CACHE_PATH)
+    
+    def _initialize_local_cache(self, path: str):
+        """
+        Abre el cache local SQLite de descripciones (segundo nivel tras el LRU).
+        
+        Args:
+            path: Ruta del archivo SQLite
+        """
+        try:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_descripciones (
+                    hash TEXT PRIMARY KEY,
+                    descripcion TEXT,
+                    uso_count INTEGER DEFAULT 1,
+                    last_used REAL
+                )
+            """)
+            conn.commit()
+            self._local_cache = conn
+            logger.info(f"Cache local SQLite abierto en {path}")
+        except sqlite3.Error as e:
+            logger.warning(f"Cache local SQLite no disponible: {e}")
+            self._local_cache = None
+    
+    @staticmethod
+    def compute_hash(obj) -> str:
+        """
+        Calcula la clave de cache (hash_objetos) de un objeto serializable.
+        
+        Args:
+            obj: Objeto a identificar (admite tipos numpy)
+            
+        Returns:
+            Hash hexadecimal de 32 caracteres, estable entre ejecuciones
+        """
+        from utils.json_helpers import safe_json_dumps
+        
+        data = safe_json_dumps(obj, sort_keys=True).encode()
+        if XXHASH_AVAILABLE:
+            return xxhash.xxh3_128_hexdigest(data)
+        return hashlib.md5(data).hexdigest()
+    
+    @abstractmethod
+    def create_or_get_user(self, nombre: str = "default") -> Dict:
+        """
+        Crea o obtiene un perfil de usuario.
+        
+        Args:
+            nombre: Nombre del usuario
+            
+        Returns:
+            Diccionario con los datos del usuario
+        """
+    
+    @abstractmethod
+    def update_user_preferences(
+        self, 
+        usuario_id: int, 
+        preferencias: Dict
+    ) -> bool:
+        """
+        Actualiza las preferencias de un usuario.
+        
+        Args:
+            usuario_id: ID del usuario
+            preferencias: Diccionario con preferencias a actualizar
+            
+        Returns:
+            True si se actualizó correctamente
+        """
+    
+    @abstractmethod
+    def save_detection(
+        self, 
+        usuario_id: int, 
+        objetos_detectados: List[Dict],
+        descripcion_generada: str
+    ) -> bool:
+        """
+        Guarda una detección en el historial.
+        
+        Args:
+            usuario_id: ID del usuario
+            objetos_detectados: Lista de objetos detectados
+            descripcion_generada: Descripción generada por el agente de lenguaje
+            
+        Returns:
+            True si se guardó correctamente
+        """
+    
+    @abstractmethod
+    def cache_descriptions_bulk(self, items: List[Tuple[str, str]]) -> bool:
+        """
+        Guarda varias descripciones en el cache.
+        
+        Args:
+            items: Lista de tuplas (hash_objetos, descripcion)
+            
+        Returns:
+            True si se guardaron correctamente
+        """
+    
+    def flush_detections(self) -> bool:
+        """
+        Escribe las detecciones pendientes, si el backend las agrupa.
+        
+        Returns:
+            True si no había pendientes o se guardaron correctamente
+        """
+        return True
+    
+    def flush_cache_descriptions(self) -> bool:
+        """
+        Escribe las descripciones pendientes, si el backend las agrupa.
+        
+        Returns:
+            True si no había pendientes o se guardaron correctamente
+        """
+        return True
+    
+    def get_cached_description(self, hash_objetos: str, labels: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Obtiene una descripción del cache si existe.
+        
+        Args:
+            hash_objetos: Hash de los objetos detectados
+            labels: Objetos con su celda de posición; con el cache semántico
+                habilitado permiten reutilizar la descripción de una escena parecida
+            
+        Returns:
+            Descripción cacheada o None
+        """
+        # Primer nivel: LRU en memoria, sin viaje a la base de datos
+        with self._desc_cache_lock:
+            descripcion = self._desc_cache.get(hash_objetos)
+            if descripcion is not None:
+                self._desc_cache.move_to_end(hash_objetos)
+                return descripcion
+        
+        # Segundo nivel: SQLite local
+        descripcion = self._get_local_description(hash_objetos)
+        if descripcion is not None:
+            self._remember_description(hash_objetos, descripcion)
+            return descripcion
+        
+        # Tercer nivel: la base de datos del backend, por hash exacto
+        descripcion = self._fetch_cached_description(hash_objetos)
+        if descripcion is not None:
+            self._remember_description(hash_objetos, descripcion)
+            self._put_local_description(hash_objetos, descripcion)
+            return descripcion
+        
+        # Último nivel: escena parecida. No se guarda bajo este hash en los
+        # niveles exactos, que solo deben servir la descripción de esta escena
+        if labels:
+            return self._fetch_similar_description(labels)
+        return None
+    
+    @abstractmethod
+    def _fetch_cached_description(self, hash_objetos: str) -> Optional[str]:
+        """Busca una descripción por hash en la base de datos del backend."""
+    
+    def _fetch_similar_description(self, labels: List[str]) -> Optional[str]:
+        """Busca la descripción de una escena parecida (sin cache semántico: None)."""
+        return None
+    
+    def cache_description(self, hash_objetos: str, descripcion: str, labels: Optional[List[str]] = None) -> bool:
+        """
+        Guarda una descripción en el cache.
+        
+        Args:
+            hash_objetos: Hash de los objetos detectados
+            descripcion: Descripción a cachear
+            labels: Objetos con su celda de posición (para el cache semántico)
+            
+        Returns:
+            True si se guardó correctamente
+        """
+        # Sustituir la entrada en memoria y en el cache local: nunca servir
+        # una descripción antigua; la base de datos se actualiza después
+        self._remember_description(hash_objetos, descripcion)
+        self._put_local_description(hash_objetos, descripcion)
+        
+        return self._store_cached_description(hash_objetos, descripcion, labels)
+    
+    @abstractmethod
+    def _store_cached_description(self, hash_objetos: str, descripcion: str, labels: Optional[List[str]]) -> bool:
+        """Guarda una descripción en la base de datos del backend."""
+    
+    def _get_local_description(self, hash_objetos: str) -> Optional[str]:
+        """Busca una descripción en el cache local SQLite y actualiza su contador."""
+        try:
+            with self._local_cache_lock:
+                if self._local_cache is None:
+                    return None
+                row = self._local_cache.execute(
+                    "SELECT descripcion FROM cache_descripciones WHERE hash = ?",
+                    (hash_objetos,)
+                ).fetchone()
+                if row is None:
+                    return None
+                self._local_cache.execute(
+                    "UPDATE cache_descripciones SET uso_count = uso_count + 1, last_used = ? WHERE hash = ?",
+                    (time.time(), hash_objetos)
+                )
+                self._local_cache.commit()
+            return row[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error al leer cache local: {e}")
+            return None
+    
+    def _put_local_description(self, hash_objetos: str, descripcion: str):
+        """Guarda (o actualiza) una descripción en el cache local SQLite."""
+        try:
+            with self._local_cache_lock:
+                if self._local_cache is None:
+                    return
+                self._local_cache.execute("""
+                    INSERT INTO cache_descripciones (hash, descripcion, uso_count, last_used)
+                    VALUES (?, ?, 1, ?)
+                    ON CONFLICT (hash) DO UPDATE SET
+                        descripcion = excluded.descripcion,
+                        uso_count = uso_count + 1,
+                        last_used = excluded.last_used
+                """, (hash_objetos, descripcion, time.time()))
+                self._local_cache.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error al escribir cache local: {e}")
+    
+    def _remember_description(self, hash_objetos: str, descripcion: str):
+        """Guarda una descripción en el LRU en memoria, expulsando la más antigua."""
+        with self._desc_cache_lock:
+            self._desc_cache[hash_objetos] = descripcion
+            self._desc_cache.move_to_end(hash_objetos)
+            if len(self._desc_cache) > self.DESC_CACHE_MAX:
+                self._desc_cache.popitem(last=False)
+    
+    def close(self):
+        """Cierra el cache local."""
+        with self._local_cache_lock:
+            if self._local_cache is not None:
+                self._local_cache.close()
+                self._local_cache = None
+
+
+class DatabaseManagerPg(DatabaseManager):
+    """Gestor de base de datos sobre conexión PostgreSQL directa (psycopg2)."""
+    
+    # Escrituras al cache agrupadas: se envían al llegar a N entradas
+    # o tras este intervalo (segundos) desde la primera pendiente
+    CACHE_FLUSH_SIZE = 100
+    CACHE_FLUSH_INTERVAL = 0.2
+    CACHE_PAGE_SIZE = 500
+    # Detecciones agrupadas igual que el cache (a ~30 fps serían 30 commits/s)
+    DETECTION_FLUSH_SIZE = 200
+    DETECTION_FLUSH_INTERVAL = 1.0
+    DETECTION_PAGE_SIZE = 200
+    # Cada cuántos segundos se revisan las conexiones ociosas
+    IDLE_PRUNE_INTERVAL = 60
+    # Sentencias preparadas una vez por conexión (el servidor las planifica una sola vez)
+    PREPARED_STATEMENTS = """
+        PREPARE get_cache(text) AS
+        UPDATE cache_descripciones
+        SET uso_count = uso_count + 1,
+            last_used = CURRENT_TIMESTAMP
+        WHERE hash_objetos = $1
+        RETURNING descripcion
+    """
+    
+    def __init__(self):
+        """Inicializa el pool de conexiones y crea las tablas si no existen."""
+        super().__init__()
         self.connection_pool = None
-        self.use_supabase = USE_SUPABASE_CLIENT and SUPABASE_AVAILABLE
+        # Conexiones ya verificadas con SELECT 1 (por id)
+        self._checked_connections = set()
+        # Conexiones con PREPARED_STATEMENTS ya registradas (por id)
+        self._prepared_connections = set()
+        self._use_prepared = False
+        # Pila de conexiones ociosas (conn, timestamp): evita el lock del pool
+        self._idle = deque()
+        self._prune_stop = threading.Event()
+        self._cache_writer = _BatchWriter(
+            self.cache_descriptions_bulk, self.CACHE_FLUSH_SIZE, self.CACHE_FLUSH_INTERVAL
+        )
+        self._detection_writer = _BatchWriter(
+            self._save_detections_bulk,
+            self.DETECTION_FLUSH_SIZE, self.DETECTION_FLUSH_INTERVAL
+        )
+        self._semantic_model = None
+        self._semantic_ready = False
         
-        if self.use_supabase:
-            self._initialize_supabase()
-        else:
-            self._initialize_postgres()
+        self._initialize_postgres()
+        if self.connection_pool:
+            threading.Thread(target=self._prune_idle_connections, daemon=True).start()
+        if SENTENCE_TRANSFORMERS_AVAILABLE:
+            self._initialize_semantic_model()
         
         self._create_tables()
     
-    def _initialize_supabase(self):
-        """Inicializa el cliente de Supabase."""
+    def _initialize_semantic_model(self):
+        """Carga el modelo de embeddings del cache semántico."""
         try:
-            if not SUPABASE_URL or not SUPABASE_KEY:
-                raise ValueError("SUPABASE_URL y SUPABASE_KEY deben estar configurados")
-            
-            self.supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-            logger.info("Cliente Supabase inicializado correctamente")
-            
+            self._semantic_model = SentenceTransformer(SEMANTIC_CACHE_MODEL)
+            logger.info(f"Modelo de embeddings cargado: {SEMANTIC_CACHE_MODEL}")
         except Exception as e:
-            logger.error(f"Error al inicializar cliente Supabase: {e}")
-            self.supabase_client = None
-            self.use_supabase = False
+            logger.warning(f"No se pudo cargar el modelo de embeddings: {e}")
+            self._semantic_model = None
     
     def _initialize_postgres(self):
         """Inicializa el pool de conexiones PostgreSQL."""
@@ -91,15 +568,11 @@ class DatabaseManager:
                     logger.info("Conectando a Supabase")
                 
                 # Crear pool de conexiones con parámetros
-                self.connection_pool = psycopg2.pool.SimpleConnectionPool(
-                    1, 10, **conn_params
-                )
+                self.connection_pool = self._create_pool(**conn_params)
             else:
                 # Para PostgreSQL local o otras conexiones, usar URL directa
                 logger.info("Conectando a PostgreSQL local o remoto")
-                self.connection_pool = psycopg2.pool.SimpleConnectionPool(
-                    1, 10, DATABASE_URL
-                )
+                self.connection_pool = self._create_pool(DATABASE_URL)
             
             if self.connection_pool:
                 logger.info("Pool de conexiones PostgreSQL inicializado correctamente")
@@ -112,9 +585,7 @@ class DatabaseManager:
             # Fallback: intentar conexión directa con URL
             try:
                 logger.info("Intentando conexión directa con URL...")
-                self.connection_pool = psycopg2.pool.SimpleConnectionPool(
-                    1, 10, DATABASE_URL
-                )
+                self.connection_pool = self._create_pool(DATABASE_URL)
                 if self.connection_pool:
                     logger.info("Pool de conexiones inicializado con URL directa")
                 else:
@@ -123,90 +594,133 @@ class DatabaseManager:
                 logger.error(f"Error en fallback de conexión: {e2}")
                 self.connection_pool = None
     
+    def _create_pool(self, *args, **kwargs):
+        """Crea un pool thread-safe (varios hilos piden conexiones a la vez)."""
+        return psycopg2.pool.ThreadedConnectionPool(
+            DB_POOL_MIN, DB_POOL_MAX, *args, **kwargs
+        )
+    
     def _get_connection(self):
         """Obtiene una conexión del pool (solo para PostgreSQL directo)."""
-        if self.connection_pool:
-            return self.connection_pool.getconn()
-        else:
+        if not self.connection_pool:
             raise Exception("Pool de conexiones no disponible")
+        
+        # Camino rápido: pop() de deque es atómico, sin pasar por el pool
+        try:
+            conn, _ = self._idle.pop()
+        except IndexError:
+            conn = self._checkout_from_pool()
+        
+        if self._use_prepared and id(conn) not in self._prepared_connections:
+            self._prepare_statements(conn)
+        return conn
+    
+    def _checkout_from_pool(self):
+        """Pide una conexión al pool, verificándola la primera vez que se usa."""
+        conn = self.connection_pool.getconn()
+        if id(conn) in self._checked_connections:
+            return conn
+        
+        # Primera vez que se usa esta conexión: comprobar que sigue viva
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error as e:
+            logger.warning(f"Conexión del pool inválida, se reemplaza: {e}")
+            self.connection_pool.putconn(conn, close=True)
+            conn = self.connection_pool.getconn()
+        
+        self._checked_connections.add(id(conn))
+        return conn
+    
+    def _prepare_statements(self, conn):
+        """Registra PREPARED_STATEMENTS en la sesión de esta conexión."""
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(self.PREPARED_STATEMENTS)
+            conn.commit()
+            self._prepared_connections.add(id(conn))
+        except psycopg2.Error as e:
+            # Sin sentencias preparadas se usa el SQL normal
+            logger.warning(f"No se pudieron preparar sentencias: {e}")
+            conn.rollback()
+    
+    def _forget_connection(self, conn):
+        """Olvida el estado registrado de una conexión que se va a cerrar."""
+        self._checked_connections.discard(id(conn))
+        self._prepared_connections.discard(id(conn))
+    
+    @staticmethod
+    def _uses_transaction_pooler() -> bool:
+        """
+        Indica si DATABASE_URL apunta a un pooler en modo transacción
+        (Supabase/pgbouncer en el puerto 6543), donde PREPARE no es seguro.
+        """
+        parsed = urlparse.urlparse(DATABASE_URL or '')
+        return parsed.port == 6543 or 'pooler' in (parsed.hostname or '')
     
     def _return_connection(self, conn):
         """Devuelve una conexión al pool (solo para PostgreSQL directo)."""
-        if self.connection_pool:
-            self.connection_pool.putconn(conn)
+        if not self.connection_pool:
+            return
+        
+        # Una conexión rota se cierra en lugar de volver al pool
+        broken = (
+            conn.closed or
+            conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN
+        )
+        if broken:
+            self._forget_connection(conn)
+        elif len(self._idle) < DB_POOL_MAX:
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._idle.append((conn, time.monotonic()))
+            return
+        
+        try:
+            self.connection_pool.putconn(conn, close=broken)
+        except Exception as e:
+            logger.warning(f"Error al devolver conexión al pool: {e}")
+    
+    def _prune_idle_connections(self):
+        """Hilo de fondo: cierra las conexiones ociosas más de DB_POOL_MAX_IDLE segundos."""
+        while not self._prune_stop.wait(self.IDLE_PRUNE_INTERVAL):
+            deadline = time.monotonic() - DB_POOL_MAX_IDLE
+            # Las más antiguas están a la izquierda (se apila por la derecha)
+            while True:
+                try:
+                    conn, last_used = self._idle.popleft()
+                except IndexError:
+                    break
+                if last_used > deadline:
+                    self._idle.appendleft((conn, last_used))
+                    break
+                self._forget_connection(conn)
+                try:
+                    self.connection_pool.putconn(conn, close=True)
+                except Exception as e:
+                    logger.warning(f"Error al cerrar conexión ociosa: {e}")
     
     def _create_tables(self):
         """Crea las tablas necesarias si no existen."""
-        if self.use_supabase:
-            # Para Supabase, usar RPC o ejecutar SQL directamente
-            # Nota: El cliente de Supabase no puede crear tablas directamente
-            # Necesitamos usar la conexión PostgreSQL o crear las tablas manualmente
-            logger.warning("Para crear tablas en Supabase, úsalas desde el dashboard o SQL Editor")
-            logger.info("Las tablas se crearán automáticamente en el primer uso si no existen")
-            return
-        
-        # Para PostgreSQL directo, crear tablas
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
             
-            # Tabla de usuarios/perfiles
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS usuarios (
-                    id SERIAL PRIMARY KEY,
-                    nombre VARCHAR(100) UNIQUE,
-                    preferencias_tts JSONB DEFAULT '{}',
-                    velocidad_habla INTEGER DEFAULT 150,
-                    volumen REAL DEFAULT 0.8,
-                    modo_detallado BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Tabla de historial de detecciones
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS detecciones (
-                    id SERIAL PRIMARY KEY,
-                    usuario_id INTEGER REFERENCES usuarios(id),
-                    objetos_detectados JSONB,
-                    descripcion_generada TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Tabla de cache de descripciones
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS cache_descripciones (
-                    id SERIAL PRIMARY KEY,
-                    hash_objetos VARCHAR(64) UNIQUE,
-                    descripcion TEXT,
-                    uso_count INTEGER DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Índices para optimización
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_detecciones_usuario 
-                ON detecciones(usuario_id)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_detecciones_timestamp 
-                ON detecciones(timestamp DESC)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_cache_hash 
-                ON cache_descripciones(hash_objetos)
-            """)
+            # Todo el esquema en una sola petición (un viaje de ida y vuelta)
+            cursor.execute(_SCHEMA_SQL)
             
             conn.commit()
             logger.info("Tablas de base de datos creadas/verificadas correctamente")
             
+            # Con las tablas creadas ya se pueden preparar sentencias sobre ellas
+            self._use_prepared = not self._uses_transaction_pooler()
+            
+            if self._semantic_model is not None:
+                self._create_semantic_schema(conn)
+            
         except Exception as e:
             logger.error(f"Error al crear tablas: {e}")
             if conn:
@@ -215,75 +729,46 @@ class DatabaseManager:
             if conn:
                 self._return_connection(conn)
     
-    def create_or_get_user(self, nombre: str = "default") -> Dict:
+    def _create_semantic_schema(self, conn):
         """
-        Crea o obtiene un perfil de usuario.
-        
-        Args:
-            nombre: Nombre del usuario
-            
-        Returns:
-            Diccionario con los datos del usuario
+        Añade la columna de embeddings (pgvector) al cache de descripciones.
+        Si la extensión no está disponible, el cache semántico queda desactivado.
         """
-        if self.use_supabase:
-            return self._create_or_get_user_supabase(nombre)
-        else:
-            return self._create_or_get_user_postgres(nombre)
+        dimension = self._semantic_model.get_sentence_embedding_dimension()
+        try:
+            cursor = conn.cursor()
+            # HNSW en lugar de ivfflat: no necesita datos previos para construirse
+            cursor.execute(f"""
+                CREATE EXTENSION IF NOT EXISTS vector;
+                ALTER TABLE cache_descripciones ADD COLUMN IF NOT EXISTS embedding vector({dimension});
+                CREATE INDEX IF NOT EXISTS idx_cache_embedding
+                ON cache_descripciones USING hnsw (embedding vector_cosine_ops);
+            """)
+            conn.commit()
+            self._semantic_ready = True
+            logger.info("Cache semántico (pgvector) habilitado")
+        except psycopg2.Error as e:
+            logger.warning(f"Cache semántico no disponible (¿falta pgvector?): {e}")
+            conn.rollback()
     
-    def _create_or_get_user_supabase(self, nombre: str) -> Dict:
-        """Crea o obtiene usuario usando cliente Supabase."""
+    def create_or_get_user(self, nombre: str = "default") -> Dict:
+        """Crea o obtiene usuario en un solo viaje a la base de datos."""
+        conn = None
         try:
-            # Intentar obtener usuario existente
-            response = self.supabase_client.table('usuarios').select('*').eq('nombre', nombre).execute()
+            conn = self._get_connection()
+            cursor = conn.cursor()
             
-            if response.data and len(response.data) > 0:
-                return response.data[0]
+            # Crear u obtener en un solo viaje: el DO UPDATE hace que RETURNING
+            # también devuelva la fila existente; xmax = 0 solo en filas nuevas
+            cursor.execute(f"""
+                INSERT INTO usuarios (nombre)
+                VALUES (%s)
+                ON CONFLICT (nombre) DO UPDATE SET updated_at = CURRENT_TIMESTAMP
+                RETURNING {_USER_COLUMNS_SQL}, (xmax = 0)
+            """, (nombre,))
             
-            # Crear nuevo usuario
-            new_user = {
-                'nombre': nombre,
-                'velocidad_habla': 150,
-                'volumen': 0.8,
-                'modo_detallado': False,
-                'preferencias_tts': {}
-            }
-            
-            response = self.supabase_client.table('usuarios').insert(new_user).execute()
-            logger.info(f"Usuario '{nombre}' creado")
-            return response.data[0] if response.data else {}
-            
-        except Exception as e:
-            logger.error(f"Error al crear/obtener usuario: {e}")
-            return {}
-    
-    def _create_or_get_user_postgres(self, nombre: str) -> Dict:
-        """Crea o obtiene usuario usando PostgreSQL directo."""
-        conn = None
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Intentar obtener usuario existente
-            cursor.execute(
-                "SELECT * FROM usuarios WHERE nombre = %s",
-                (nombre,)
-            )
-            user = cursor.fetchone()
-            
-            if user:
-                return dict(user)
-            
-            # Crear nuevo usuario
-            cursor.execute("""
-                INSERT INTO usuarios (nombre)
-                VALUES (%s)
-                RETURNING *
-            """, (nombre,))
-            
-            user = cursor.fetchone()
+            *row, creado = cursor.fetchone()
             conn.commit()
-            logger.info(f"Usuario '{nombre}' creado")
-            return dict(user)
             
         except Exception as e:
             logger.error(f"Error al crear/obtener usuario: {e}")
@@ -293,89 +778,28 @@ class DatabaseManager:
         finally:
             if conn:
                 self._return_connection(conn)
-    
-    def update_user_preferences(
-        self, 
-        usuario_id: int, 
-        preferencias: Dict
-    ) -> bool:
-        """
-        Actualiza las preferencias de un usuario.
         
-        Args:
-            usuario_id: ID del usuario
-            preferencias: Diccionario con preferencias a actualizar
-            
-        Returns:
-            True si se actualizó correctamente
-        """
-        if self.use_supabase:
-            return self._update_user_preferences_supabase(usuario_id, preferencias)
-        else:
-            return self._update_user_preferences_postgres(usuario_id, preferencias)
+        # Fuera de la ventana de la conexión: ya está de vuelta en el pool
+        if creado:
+            logger.info(f"Usuario '{nombre}' creado")
+        return dict(zip(_USER_COLUMNS, row))
     
-    def _update_user_preferences_supabase(self, usuario_id: int, preferencias: Dict) -> bool:
-        """Actualiza preferencias usando cliente Supabase."""
-        try:
-            # Preparar datos para actualizar
-            update_data = {}
-            if 'velocidad_habla' in preferencias:
-                update_data['velocidad_habla'] = preferencias['velocidad_habla']
-            if 'volumen' in preferencias:
-                update_data['volumen'] = preferencias['volumen']
-            if 'modo_detallado' in preferencias:
-                update_data['modo_detallado'] = preferencias['modo_detallado']
-            if 'preferencias_tts' in preferencias:
-                update_data['preferencias_tts'] = preferencias['preferencias_tts']
-            
-            if update_data:
-                response = self.supabase_client.table('usuarios').update(update_data).eq('id', usuario_id).execute()
-                logger.info(f"Preferencias del usuario {usuario_id} actualizadas")
-                return True
-            
-            return False
-            
-        except Exception as e:
-            logger.error(f"Error al actualizar preferencias: {e}")
+    def update_user_preferences(self, usuario_id: int, preferencias: Dict) -> bool:
+        """Actualiza preferencias con el UPDATE precalculado para sus claves."""
+        template = _UPDATE_TEMPLATES.get(frozenset(k for k in preferencias if k in _PREFERENCE_KEYS))
+        if template is None:
             return False
-    
-    def _update_user_preferences_postgres(self, usuario_id: int, preferencias: Dict) -> bool:
-        """Actualiza preferencias usando PostgreSQL directo."""
+        
+        columns, query = template
+        values = [preferencias[column] for column in columns]
+        values.append(usuario_id)
+        
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            
-            updates = []
-            values = []
-            
-            if 'velocidad_habla' in preferencias:
-                updates.append("velocidad_habla = %s")
-                values.append(preferencias['velocidad_habla'])
-            
-            if 'volumen' in preferencias:
-                updates.append("volumen = %s")
-                values.append(preferencias['volumen'])
-            
-            if 'modo_detallado' in preferencias:
-                updates.append("modo_detallado = %s")
-                values.append(preferencias['modo_detallado'])
-            
-            if 'preferencias_tts' in preferencias:
-                updates.append("preferencias_tts = %s")
-                values.append(preferencias['preferencias_tts'])
-            
-            if updates:
-                updates.append("updated_at = CURRENT_TIMESTAMP")
-                values.append(usuario_id)
-                
-                query = f"UPDATE usuarios SET {', '.join(updates)} WHERE id = %s"
-                cursor.execute(query, values)
-                conn.commit()
-                logger.info(f"Preferencias del usuario {usuario_id} actualizadas")
-                return True
-            
-            return False
+            cursor.execute(query, values)
+            conn.commit()
             
         except Exception as e:
             logger.error(f"Error al actualizar preferencias: {e}")
@@ -385,72 +809,52 @@ class DatabaseManager:
         finally:
             if conn:
                 self._return_connection(conn)
-    
-    def save_detection(
-        self, 
-        usuario_id: int, 
-        objetos_detectados: List[Dict],
-        descripcion_generada: str
-    ) -> bool:
-        """
-        Guarda una detección en el historial.
         
-        Args:
-            usuario_id: ID del usuario
-            objetos_detectados: Lista de objetos detectados
-            descripcion_generada: Descripción generada por el agente de lenguaje
-            
-        Returns:
-            True si se guardó correctamente
-        """
-        if self.use_supabase:
-            return self._save_detection_supabase(usuario_id, objetos_detectados, descripcion_generada)
-        else:
-            return self._save_detection_postgres(usuario_id, objetos_detectados, descripcion_generada)
+        logger.info(f"Preferencias del usuario {usuario_id} actualizadas")
+        return True
     
-    def _save_detection_supabase(self, usuario_id: int, objetos_detectados: List[Dict], descripcion_generada: str) -> bool:
-        """Guarda detección usando cliente Supabase."""
+    def save_detection(self, usuario_id: int, objetos_detectados: List[Dict], descripcion_generada: str) -> bool:
+        """Encola la detección; se escribe en lote con _save_detections_bulk."""
         try:
-            # Convertir objetos numpy a tipos nativos de Python para serialización JSON
-            from utils.json_helpers import convert_to_serializable
-            
-            objetos_serializables = convert_to_serializable(objetos_detectados)
-            
-            detection_data = {
-                'usuario_id': usuario_id,
-                'objetos_detectados': objetos_serializables,
-                'descripcion_generada': descripcion_generada
-            }
+            from utils.json_helpers import safe_json_dumps
             
-            response = self.supabase_client.table('detecciones').insert(detection_data).execute()
-            return True
+            # Usar safe_json_dumps para convertir tipos numpy
+            objetos_json = safe_json_dumps(objetos_detectados)
+            return self._detection_writer.add((usuario_id, objetos_json, descripcion_generada))
             
         except Exception as e:
             logger.error(f"Error al guardar detección: {e}")
             return False
     
-    def _save_detection_postgres(self, usuario_id: int, objetos_detectados: List[Dict], descripcion_generada: str) -> bool:
-        """Guarda detección usando PostgreSQL directo."""
+    def flush_detections(self) -> bool:
+        """
+        Escribe las detecciones pendientes del buffer en una sola transacción.
+        
+        Returns:
+            True si no había pendientes o se guardaron correctamente
+        """
+        return self._detection_writer.flush()
+    
+    def _save_detections_bulk(self, rows: List[Tuple[int, str, str]]) -> bool:
+        """Guarda detecciones en lote (un commit por lote)."""
         conn = None
         try:
-            from utils.json_helpers import safe_json_dumps
-            
             conn = self._get_connection()
             cursor = conn.cursor()
             
-            # Usar safe_json_dumps para convertir tipos numpy
-            objetos_json = safe_json_dumps(objetos_detectados)
-            
-            cursor.execute("""
+            # El historial tolera perder el último lote ante una caída del
+            # servidor: el COMMIT no espera al fsync del WAL (solo esta transacción)
+            cursor.execute("SET LOCAL synchronous_commit TO off")
+            execute_values(cursor, """
                 INSERT INTO detecciones (usuario_id, objetos_detectados, descripcion_generada)
-                VALUES (%s, %s, %s)
-            """, (usuario_id, objetos_json, descripcion_generada))
+                VALUES %s
+            """, rows, page_size=self.DETECTION_PAGE_SIZE)
             
             conn.commit()
             return True
             
         except Exception as e:
-            logger.error(f"Error al guardar detección: {e}")
+            logger.error(f"Error al guardar lote de detecciones: {e}")
             if conn:
                 conn.rollback()
             return False
@@ -458,139 +862,126 @@ class DatabaseManager:
             if conn:
                 self._return_connection(conn)
     
-    def get_cached_description(self, hash_objetos: str) -> Optional[str]:
-        """
-        Obtiene una descripción del cache si existe.
-        
-        Args:
-            hash_objetos: Hash de los objetos detectados
-            
-        Returns:
-            Descripción cacheada o None
-        """
-        if self.use_supabase:
-            return self._get_cached_description_supabase(hash_objetos)
-        else:
-            return self._get_cached_description_postgres(hash_objetos)
-    
-    def _get_cached_description_supabase(self, hash_objetos: str) -> Optional[str]:
-        """Obtiene descripción cacheada usando cliente Supabase."""
+    def _fetch_cached_description(self, hash_objetos: str) -> Optional[str]:
+        """Obtiene descripción cacheada por hash y actualiza su contador."""
+        conn = None
         try:
-            response = self.supabase_client.table('cache_descripciones').select('*').eq('hash_objetos', hash_objetos).execute()
+            conn = self._get_connection()
+            # Una sola sentencia: autocommit evita el COMMIT explícito
+            conn.autocommit = True
+            cursor = conn.cursor()
             
-            if response.data and len(response.data) > 0:
-                cached = response.data[0]
-                # Actualizar contador y timestamp
-                new_count = cached.get('uso_count', 1) + 1
-                self.supabase_client.table('cache_descripciones').update({
-                    'uso_count': new_count
-                }).eq('hash_objetos', hash_objetos).execute()
-                
-                return cached['descripcion']
+            # Lectura y actualización de contador/timestamp en un solo viaje
+            if id(conn) in self._prepared_connections:
+                cursor.execute("EXECUTE get_cache(%s)", (hash_objetos,))
+            else:
+                cursor.execute("""
+                    UPDATE cache_descripciones
+                    SET uso_count = uso_count + 1,
+                        last_used = CURRENT_TIMESTAMP
+                    WHERE hash_objetos = %s
+                    RETURNING descripcion
+                """, (hash_objetos,))
             
-            return None
+            result = cursor.fetchone()
+            return result[0] if result else None
             
         except Exception as e:
             logger.error(f"Error al obtener descripción cacheada: {e}")
             return None
+        finally:
+            if conn:
+                try:
+                    # Restaurar el modo transaccional antes de devolverla al pool
+                    # (en una conexión caída falla; _return_connection la descarta)
+                    if not conn.closed:
+                        conn.autocommit = False
+                except psycopg2.Error as e:
+                    logger.warning(f"No se pudo restaurar autocommit: {e}")
+                    # No debe volver al pool en modo autocommit
+                    conn.close()
+                finally:
+                    self._return_connection(conn)
+    
+    def _embed_labels(self, labels: List[str]) -> str:
+        """Calcula el embedding de la lista ordenada de objetos (con posición) en formato pgvector."""
+        from utils.json_helpers import safe_json_dumps
+        
+        embedding = self._semantic_model.encode(", ".join(sorted(labels)), normalize_embeddings=True)
+        return safe_json_dumps(embedding)
     
-    def _get_cached_description_postgres(self, hash_objetos: str) -> Optional[str]:
-        """Obtiene descripción cacheada usando PostgreSQL directo."""
+    def _fetch_similar_description(self, labels: List[str]) -> Optional[str]:
+        """Busca la descripción de la escena más parecida (pgvector)."""
+        if not self._semantic_ready:
+            return None
+        
         conn = None
         try:
+            # El embedding se calcula antes de pedir la conexión
+            embedding = self._embed_labels(labels)
+            
             conn = self._get_connection()
             cursor = conn.cursor()
-            
             cursor.execute("""
-                SELECT descripcion FROM cache_descripciones
-                WHERE hash_objetos = %s
-            """, (hash_objetos,))
-            
+                SELECT descripcion, embedding <=> %s::vector AS distancia
+                FROM cache_descripciones
+                WHERE embedding IS NOT NULL
+                ORDER BY embedding <=> %s::vector
+                LIMIT 1
+            """, (embedding, embedding))
             result = cursor.fetchone()
             
-            if result:
-                # Actualizar contador y timestamp
-                cursor.execute("""
-                    UPDATE cache_descripciones
-                    SET uso_count = uso_count + 1,
-                        last_used = CURRENT_TIMESTAMP
-                    WHERE hash_objetos = %s
-                """, (hash_objetos,))
-                conn.commit()
-                return result[0]
-            
-            return None
-            
         except Exception as e:
-            logger.error(f"Error al obtener descripción cacheada: {e}")
+            logger.error(f"Error en la búsqueda semántica: {e}")
             if conn:
                 conn.rollback()
             return None
         finally:
             if conn:
                 self._return_connection(conn)
+        
+        if result and result[1] <= SEMANTIC_CACHE_MAX_DISTANCE:
+            logger.debug(f"Descripción semántica reutilizada (distancia {result[1]:.3f})")
+            return result[0]
+        return None
+    
+    def _store_cached_description(self, hash_objetos: str, descripcion: str, labels: Optional[List[str]]) -> bool:
+        """Encola la descripción; se escribe en lote con cache_descriptions_bulk."""
+        if labels and self._semantic_ready:
+            try:
+                return self._cache_writer.add((hash_objetos, descripcion, self._embed_labels(labels)))
+            except Exception as e:
+                logger.error(f"Error al calcular embedding: {e}")
+        return self._cache_writer.add((hash_objetos, descripcion))
     
-    def cache_description(self, hash_objetos: str, descripcion: str) -> bool:
+    def flush_cache_descriptions(self) -> bool:
         """
-        Guarda una descripción en el cache.
+        Escribe las descripciones pendientes del buffer en una sola transacción.
         
-        Args:
-            hash_objetos: Hash de los objetos detectados
-            descripcion: Descripción a cachear
-            
         Returns:
-            True si se guardó correctamente
+            True si no había pendientes o se guardaron correctamente
         """
-        if self.use_supabase:
-            return self._cache_description_supabase(hash_objetos, descripcion)
-        else:
-            return self._cache_description_postgres(hash_objetos, descripcion)
-    
-    def _cache_description_supabase(self, hash_objetos: str, descripcion: str) -> bool:
-        """Cachea descripción usando cliente Supabase."""
-        try:
-            # Verificar si ya existe
-            existing = self.supabase_client.table('cache_descripciones').select('uso_count').eq('hash_objetos', hash_objetos).execute()
-            
-            if existing.data and len(existing.data) > 0:
-                # Actualizar existente
-                new_count = existing.data[0].get('uso_count', 1) + 1
-                self.supabase_client.table('cache_descripciones').update({
-                    'descripcion': descripcion,
-                    'uso_count': new_count
-                }).eq('hash_objetos', hash_objetos).execute()
-            else:
-                # Insertar nuevo
-                cache_data = {
-                    'hash_objetos': hash_objetos,
-                    'descripcion': descripcion,
-                    'uso_count': 1
-                }
-                self.supabase_client.table('cache_descripciones').insert(cache_data).execute()
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error al cachear descripción: {e}")
-            return False
+        return self._cache_writer.flush()
     
-    def _cache_description_postgres(self, hash_objetos: str, descripcion: str) -> bool:
-        """Cachea descripción usando PostgreSQL directo."""
+    def cache_descriptions_bulk(self, items: List[Tuple[str, str]]) -> bool:
+        """Cachea descripciones en lote (un commit por lote)."""
+        # ON CONFLICT no admite dos filas con la misma clave en una sentencia:
+        # conservar solo la última descripción de cada hash
+        latest = {item[0]: item for item in items}
+        
+        # Filas y sentencia listas antes de pedir la conexión
+        if self._semantic_ready:
+            query, template = _CACHE_UPSERT_EMBEDDING_SQL, "(%s, %s, %s::vector)"
+            rows = [(h, d, embedding[0] if embedding else None) for h, d, *embedding in latest.values()]
+        else:
+            query, template = _CACHE_UPSERT_SQL, None
+            rows = [(h, d) for h, d, *_ in latest.values()]
+        
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO cache_descripciones (hash_objetos, descripcion)
-                VALUES (%s, %s)
-                ON CONFLICT (hash_objetos) 
-                DO UPDATE SET 
-                    descripcion = EXCLUDED.descripcion,
-                    uso_count = cache_descripciones.uso_count + 1,
-                    last_used = CURRENT_TIMESTAMP
-            """, (hash_objetos, descripcion))
-            
+            execute_values(cursor, query, rows, template=template, page_size=self.CACHE_PAGE_SIZE)
             conn.commit()
             return True
             
@@ -604,7 +995,158 @@ class DatabaseManager:
                 self._return_connection(conn)
     
     def close(self):
-        """Cierra las conexiones."""
+        """Vacía los buffers pendientes y cierra las conexiones (idempotente)."""
         if self.connection_pool:
+            # Primero los buffers: necesitan el pool todavía abierto
+            if not self.flush_detections():
+                logger.error("Se perdieron detecciones pendientes al cerrar")
+            if not self.flush_cache_descriptions():
+                logger.error("Se perdieron descripciones pendientes al cerrar")
+            self._prune_stop.set()
+            self._idle.clear()
             self.connection_pool.closeall()
+            self.connection_pool = None
             logger.info("Pool de conexiones cerrado")
+        super().close()
+
+
+class DatabaseManagerSupabase(DatabaseManager):
+    """Gestor de base de datos sobre el cliente Supabase (API REST)."""
+    
+    def __init__(self):
+        """Inicializa el cliente de Supabase."""
+        super().__init__()
+        self.supabase_client = None
+        self._initialize_supabase()
+        
+        # El cliente de Supabase no puede crear tablas directamente
+        logger.warning("Para crear tablas en Supabase, úsalas desde el dashboard o SQL Editor")
+        logger.info("Las tablas se crearán automáticamente en el primer uso si no existen")
+    
+    def _initialize_supabase(self):
+        """Inicializa el cliente de Supabase."""
+        try:
+            if not SUPABASE_URL or not SUPABASE_KEY:
+                raise ValueError("SUPABASE_URL y SUPABASE_KEY deben estar configurados")
+            
+            self.supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+            logger.info("Cliente Supabase inicializado correctamente")
+            
+        except Exception as e:
+            logger.error(f"Error al inicializar cliente Supabase: {e}")
+            self.supabase_client = None
+    
+    def create_or_get_user(self, nombre: str = "default") -> Dict:
+        """Crea o obtiene usuario usando cliente Supabase."""
+        try:
+            # Intentar obtener usuario existente
+            response = self.supabase_client.table('usuarios').select('*').eq('nombre', nombre).execute()
+            
+            if response.data and len(response.data) > 0:
+                return response.data[0]
+            
+            # Crear nuevo usuario
+            new_user = {
+                'nombre': nombre,
+                'velocidad_habla': 150,
+                'volumen': 0.8,
+                'modo_detallado': False,
+                'preferencias_tts': {}
+            }
+            
+            response = self.supabase_client.table('usuarios').insert(new_user).execute()
+            logger.info(f"Usuario '{nombre}' creado")
+            return response.data[0] if response.data else {}
+            
+        except Exception as e:
+            logger.error(f"Error al crear/obtener usuario: {e}")
+            return {}
+    
+    def update_user_preferences(self, usuario_id: int, preferencias: Dict) -> bool:
+        """Actualiza preferencias usando cliente Supabase."""
+        try:
+            # Preparar datos para actualizar
+            update_data = {}
+            if 'velocidad_habla' in preferencias:
+                update_data['velocidad_habla'] = preferencias['velocidad_habla']
+            if 'volumen' in preferencias:
+                update_data['volumen'] = preferencias['volumen']
+            if 'modo_detallado' in preferencias:
+                update_data['modo_detallado'] = preferencias['modo_detallado']
+            if 'preferencias_tts' in preferencias:
+                update_data['preferencias_tts'] = preferencias['preferencias_tts']
+            
+            if update_data:
+                response = self.supabase_client.table('usuarios').update(update_data).eq('id', usuario_id).execute()
+                logger.info(f"Preferencias del usuario {usuario_id} actualizadas")
+                return True
+            
+            return False
+            
+        except Exception as e:
+            logger.error(f"Error al actualizar preferencias: {e}")
+            return False
+    
+    def save_detection(self, usuario_id: int, objetos_detectados: List[Dict], descripcion_generada: str) -> bool:
+        """Guarda detección usando cliente Supabase."""
+        try:
+            # Convertir objetos numpy a tipos nativos de Python para serialización JSON
+            from utils.json_helpers import convert_to_serializable
+            
+            objetos_serializables = convert_to_serializable(objetos_detectados)
+            
+            detection_data = {
+                'usuario_id': usuario_id,
+                'objetos_detectados': objetos_serializables,
+                'descripcion_generada': descripcion_generada
+            }
+            
+            response = self.supabase_client.table('detecciones').insert(detection_data).execute()
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error al guardar detección: {e}")
+            return False
+    
+    def _fetch_cached_description(self, hash_objetos: str) -> Optional[str]:
+        """Obtiene descripción cacheada usando cliente Supabase."""
+        try:
+            # Función RPC bump_cache (ver SUPABASE_SETUP.md): lectura y
+            # actualización de contador en el servidor, una sola petición
+            response = self.supabase_client.rpc('bump_cache', {'h': hash_objetos}).execute()
+            return response.data or None
+            
+        except Exception as e:
+            logger.error(f"Error al obtener descripción cacheada: {e}")
+            return None
+    
+    def _store_cached_description(self, hash_objetos: str, descripcion: str, labels: Optional[List[str]] = None) -> bool:
+        """Cachea descripción usando cliente Supabase."""
+        try:
+            # Función RPC upsert_cache (ver SUPABASE_SETUP.md): INSERT ... ON CONFLICT
+            self.supabase_client.rpc('upsert_cache', {
+                'h': hash_objetos,
+                'd': descripcion
+            }).execute()
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error al cachear descripción: {e}")
+            return False
+    
+    def cache_descriptions_bulk(self, items: List[Tuple[str, str]]) -> bool:
+        """Cachea descripciones una a una (la API REST no agrupa el UPSERT con contador)."""
+        return all([self._store_cached_description(h, d) for h, d, *_ in items])
+
+
+def make_db() -> DatabaseManager:
+    """
+    Crea el gestor de base de datos adecuado a la configuración.
+    
+    Returns:
+        DatabaseManagerSupabase si hay cliente Supabase configurado y disponible,
+        DatabaseManagerPg en otro caso
+    """
+    if USE_SUPABASE_CLIENT and SUPABASE_AVAILABLE:
+        return DatabaseManagerSupabase()
+    return DatabaseManagerPg()
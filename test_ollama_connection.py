@@ -4,6 +4,16 @@ Script rápido para verificar si OLLAMA está corriendo y accesible.
 
 import requests
 import json
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+# Sesión compartida: todas las consultas a OLLAMA reutilizan la conexión (keep-alive)
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.2)
+))
 
 def test_ollama():
     """Prueba la conexión con OLLAMA."""
@@ -14,7 +24,7 @@ def test_ollama():
     try:
         # Probar conexión básica
         print(f"1. Probando conexión a {base_url}...")
-        response = requests.get(f"{base_url}/api/tags", timeout=5)
+        response = SESSION.get(f"{base_url}/api/tags", timeout=5)
         
         if response.status_code == 200:
             print("   ✅ OLLAMA está corriendo y respondiendo\n")
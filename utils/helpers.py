@@ -2,9 +2,12 @@
 Funciones auxiliares para validación, formateo y logging.
 """
 
+import io
 import logging
 import cv2
+import numpy as np
 import requests
+from PIL import Image
 from typing import Tuple, List, Dict
 from config import OLLAMA_BASE_URL, CAMERA_INDEX, LOG_LEVEL, LOG_FILE
 
@@ -156,3 +159,18 @@ def calculate_bbox_position(
         'height': y2 - y1
     }
 
+
+def encode_frame_jpeg(frame_rgb: np.ndarray, quality: int = 85) -> bytes:
+    """
+    Codifica un frame RGB como JPEG para mostrarlo en Streamlit.
+    
+    Args:
+        frame_rgb: Frame de video en RGB
+        quality: Calidad JPEG (1-95)
+        
+    Returns:
+        Bytes de la imagen JPEG
+    """
+    buffer = io.BytesIO()
+    Image.fromarray(frame_rgb).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
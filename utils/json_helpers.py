@@ -6,6 +6,36 @@ import json
 import numpy as np
 from typing import Any
 
+# Serializador acelerado (orjson) si está instalado; soporta numpy de forma nativa
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+class NumpyJSONEncoder(json.JSONEncoder):
+    """
+    Encoder JSON que convierte escalares y arrays de numpy.
+    
+    `json.dumps` solo llama a `default` para los valores que no sabe
+    serializar, así que el resto del árbol se recorre en C sin copiarlo.
+    """
+    
+    def default(self, obj: Any) -> Any:
+        if isinstance(obj, np.integer):
+            return int(obj)
+        if isinstance(obj, np.floating):
+            return float(obj)
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        return super().default(obj)
+
+
+# Respaldo de orjson para lo que no serializa solo (p. ej. arrays no contiguos)
+_numpy_default = NumpyJSONEncoder().default
+
 
 def convert_to_serializable(obj: Any) -> Any:
     """
@@ -17,30 +47,23 @@ def convert_to_serializable(obj: Any) -> Any:
     Returns:
         Objeto serializable
     """
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_to_serializable(value) for key, value in obj.items()}
-    elif isinstance(obj, (list, tuple)):
-        return [convert_to_serializable(item) for item in obj]
-    else:
-        return obj
-
-
-def safe_json_dumps(obj: Any) -> str:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(orjson.dumps(obj, default=_numpy_default, option=_ORJSON_OPTIONS))
+    return json.loads(safe_json_dumps(obj))
+
+
+def safe_json_dumps(obj: Any, sort_keys: bool = False) -> str:
     """
     Serializa un objeto a JSON de forma segura, convirtiendo tipos numpy.
     
     Args:
         obj: Objeto a serializar
+        sort_keys: Si es True, ordena las claves (salida determinista)
         
     Returns:
         String JSON
     """
-    serializable_obj = convert_to_serializable(obj)
-    return json.dumps(serializable_obj)
-
+    if ORJSON_AVAILABLE:
+        option = _ORJSON_OPTIONS | orjson.OPT_SORT_KEYS if sort_keys else _ORJSON_OPTIONS
+        return orjson.dumps(obj, default=_numpy_default, option=option).decode()
+    return json.dumps(obj, cls=NumpyJSONEncoder, sort_keys=sort_keys)